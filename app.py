@@ -2,6 +2,12 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import os
+import shutil
+import tempfile
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -9,6 +15,10 @@ st.set_page_config(page_title="Sales Dashboard", layout="wide")
 
 DATA_PATH = Path("data/sales.csv")
 DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
+CATEGORY_COLUMNS = ("product", "channel")
+TABLE_ROW_LIMIT = 1000
+# Parquet schema metadata key recording which CSV the cached copy was built from
+PARQUET_SOURCE_KEY = b"source_csv"
 
 # ---------------------------
 # Mock data bootstrap (first run)
@@ -21,29 +31,161 @@ def bootstrap_mock_data(n_orders: int = 1200, seed: int = 7) -> pd.DataFrame:
     dates = pd.to_datetime(rng.choice(pd.date_range(start, end, freq="D"), n_orders))
     products = np.array(["Basic", "Plus", "Pro", "Enterprise"])
     channels = np.array(["In-Store", "Online", "Phone"])
-    prices = {"Basic": 19, "Plus": 39, "Pro": 79, "Enterprise": 199}
+    prices = np.array([19, 39, 79, 199], dtype=np.int32)
+    product_idx = rng.choice(len(products), n_orders, p=[0.35, 0.35, 0.22, 0.08])
 
     df = pd.DataFrame({
         "order_id": np.arange(1, n_orders + 1),
         "date": dates,
-        "product": rng.choice(products, n_orders, p=[0.35, 0.35, 0.22, 0.08]),
+        "product": pd.Categorical.from_codes(product_idx, products),
         "channel": rng.choice(channels, n_orders, p=[0.50, 0.45, 0.05]),
         "quantity": rng.integers(1, 5, n_orders),
         "customer_id": rng.integers(10_000, 99_999, n_orders),
     })
-    df["unit_price"] = df["product"].map(prices)
+    df["unit_price"] = prices[product_idx]
     df["revenue"] = df["unit_price"] * df["quantity"]
     df.sort_values("date", inplace=True)
     return df
 
+def csv_signature(path: Path) -> str:
+    stat = path.stat()
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+def read_parquet(csv_path: Path, source: str) -> pd.DataFrame | None:
+    # Only trust a copy built from exactly this CSV; `mv` can keep an older mtime.
+    # A missing, truncated or unreadable copy is just a cache miss.
+    try:
+        pf = pq.ParquetFile(csv_path.with_suffix(".parquet"))
+        if (pf.schema_arrow.metadata or {}).get(PARQUET_SOURCE_KEY) != source.encode():
+            return None
+        return pf.read().to_pandas()
+    except (OSError, ValueError, pa.ArrowException):
+        return None
+
+def write_parquet(df: pd.DataFrame, csv_path: Path, source: str) -> None:
+    # Write to a temp file and rename it so readers never see a partial file.
+    # The Parquet copy is only a cache: if it can't be written, the CSV still serves.
+    try:
+        fd, tmp = tempfile.mkstemp(dir=csv_path.parent, suffix=".tmp")
+    except OSError:
+        return
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), PARQUET_SOURCE_KEY: source.encode()}
+        )
+        with os.fdopen(fd, "wb") as f:
+            pq.write_table(table, f)
+        # mkstemp creates 0600 files; make the copy as readable as the CSV it caches
+        shutil.copymode(csv_path, tmp)
+        os.replace(tmp, csv_path.with_suffix(".parquet"))
+    except (OSError, ValueError, TypeError, pa.ArrowException):
+        # e.g. read-only dir, duplicate column names, mixed-type object columns
+        pass
+    finally:
+        Path(tmp).unlink(missing_ok=True)
+
 if not DATA_PATH.exists():
-    bootstrap_mock_data().to_csv(DATA_PATH, index=False)
+    mock = bootstrap_mock_data()
+    mock.to_csv(DATA_PATH, index=False)
+    write_parquet(mock, DATA_PATH, csv_signature(DATA_PATH))
 
-@st.cache_data
-def load_data(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path, parse_dates=["date"])
+def prepare_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # Ensure an order_id exists (some uploads won't have it)
+    if "order_id" not in df.columns:
+        df["order_id"] = np.arange(1, len(df) + 1)
+    # Keep rows in date order so the date filter can binary-search
+    df = df.sort_values("date", kind="stable", ignore_index=True)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            cats = df[col].astype("category")
+            # Arrow dictionaries arrive in first-seen order; keep the options sorted
+            df[col] = cats.cat.reorder_categories(sorted(cats.cat.categories))
+    # Integer month key (months since epoch) so monthly totals are a bincount
+    df["_mkey"] = df["date"].to_numpy("datetime64[M]").view("int64").astype(np.int32)
     return df
 
+@st.cache_data(max_entries=1)
+def load_data(path: Path, signature: str) -> pd.DataFrame:
+    # signature (CSV mtime_ns:size) is the cache key: replacing the CSV invalidates
+    # both the cached frame and the Parquet copy built from the old file
+    df = read_parquet(path, signature)
+    if df is None:
+        convert = pacsv.ConvertOptions(
+            column_types={
+                "date": pa.timestamp("ns"),
+                **{col: pa.dictionary(pa.int32(), pa.string()) for col in CATEGORY_COLUMNS},
+            },
+            strings_can_be_null=True,
+        )
+        try:
+            df = pacsv.read_csv(path, convert_options=convert).to_pandas()
+        except pa.ArrowInvalid:
+            # Arrow only parses ISO dates; let pandas handle other formats
+            df = pd.read_csv(path, parse_dates=["date"])
+        if df.columns.has_duplicates:
+            # Arrow keeps repeated headers as-is; pandas renames them (note, note.1)
+            df = pd.read_csv(path, parse_dates=["date"])
+        write_parquet(df, path, signature)
+    return prepare_frame(df)
+
+@st.cache_data(show_spinner=False)
+def csv_snapshot(path: Path, mtime: float, size: int, n_bytes: int = 1000) -> str:
+    # mtime/size are cache keys: the file is only re-read when it changes
+    with open(path, "rb") as f:
+        head = f.read(n_bytes).decode("utf-8", errors="replace")
+    return head + ("\n...\n" if size > n_bytes else "")
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def csv_bytes(_fdf: pd.DataFrame, source: str, start: pd.Timestamp, end: pd.Timestamp,
+              products: list, channels: list) -> bytes:
+    # _fdf is not hashed: the source identity plus the filter state determine it
+    return _fdf.drop(columns="_mkey").to_csv(index=False).encode("utf-8")
+
+def group_totals(keys: np.ndarray | pd.Categorical, vals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    codes, uniques = pd.factorize(keys)
+    keep = (codes >= 0) & ~np.isnan(vals)
+    totals = np.bincount(codes[keep], weights=vals[keep], minlength=len(uniques))
+    return uniques, totals
+
+def top_group(keys: np.ndarray | pd.Categorical, vals: np.ndarray) -> tuple[str, float]:
+    uniques, totals = group_totals(keys, vals)
+    if not len(totals):
+        return "—", 0.0
+    i = int(totals.argmax())
+    return uniques[i], float(totals[i])
+
+def month_totals(mkeys: np.ndarray, vals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    keep = ~np.isnan(vals)
+    offset = mkeys.min()
+    totals = np.bincount(mkeys[keep] - offset, weights=vals[keep])
+    months = np.arange(offset, offset + len(totals)).astype("datetime64[M]")
+    return months.astype("datetime64[ns]"), totals
+
+def category_mask(col: pd.Series, selected: list) -> np.ndarray:
+    codes = col.cat.codes.to_numpy()
+    sel = col.cat.categories.get_indexer(selected)
+    return np.isin(codes, sel[sel >= 0].astype(codes.dtype))
+
+def filter_rows(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp,
+                products: list, channels: list) -> np.ndarray:
+    # df is sorted by date (prepare_frame), so the date range is a contiguous slice
+    dates = df["date"].to_numpy("datetime64[ns]")
+    lo = np.searchsorted(dates, start.to_datetime64(), side="left")
+    hi = np.searchsorted(dates, end.to_datetime64(), side="right")
+    window = df.iloc[lo:hi]
+    mask = category_mask(window["product"], products) & category_mask(window["channel"], channels)
+    # Positions into df, so callers take only the columns they need
+    return lo + np.flatnonzero(mask)
+
+def compute_kpis(revenue: np.ndarray, order_ids: np.ndarray,
+                 product: pd.Categorical) -> tuple[float, int, float, str, float]:
+    total_rev = float(np.nansum(revenue))
+    orders = int(pd.Series(order_ids).nunique())
+    aov = (total_rev / orders) if orders else 0.0
+    top_product_name, top_product_rev = top_group(product, revenue)
+    return total_rev, orders, aov, top_product_name, top_product_rev
+
 # ---------------------------
 # Source data: upload or fallback
 # ---------------------------
@@ -67,13 +209,12 @@ if up is not None:
             df["revenue"] = df["quantity"] * df["unit_price"]
         else:
             st.error("Add a 'revenue' column OR both 'quantity' and 'unit_price'."); st.stop()
+    df = prepare_frame(df)
+    source = up.file_id
 else:
-    df = load_data(DATA_PATH)
-
-# Ensure an order_id exists (some uploads won't have it)
-if "order_id" not in df.columns:
-    df = df.copy()
-    df["order_id"] = np.arange(1, len(df) + 1)
+    signature = csv_signature(DATA_PATH)
+    df = load_data(DATA_PATH, signature)
+    source = f"{DATA_PATH}@{signature}"
 
 # ---------------------------
 # Sidebar filters (date + quick presets + facets)
@@ -91,22 +232,21 @@ if range_choice != "All":
     days = int(range_choice.split()[1])
     start_d = pd.Timestamp.today().normalize() - pd.Timedelta(days=days)
 
-prod_sel = st.sidebar.multiselect("Products", sorted(df["product"].dropna().unique().tolist()),
-                                  default=sorted(df["product"].dropna().unique().tolist()))
-chan_sel = st.sidebar.multiselect("Channels", sorted(df["channel"].dropna().unique().tolist()),
-                                  default=sorted(df["channel"].dropna().unique().tolist()))
+products = df["product"].cat.categories.tolist()
+channels = df["channel"].cat.categories.tolist()
+prod_sel = st.sidebar.multiselect("Products", products, default=products)
+chan_sel = st.sidebar.multiselect("Channels", channels, default=channels)
 
-mask = (
-    df["date"].between(start_d, end_d) &
-    df["product"].isin(prod_sel) &
-    df["channel"].isin(chan_sel)
-)
-fdf = df.loc[mask].copy()
+rows = filter_rows(df, start_d, end_d, prod_sel, chan_sel)
+revenue = df["revenue"].to_numpy(np.float64, na_value=np.nan)[rows]
+product = df["product"].array[rows]
+# The table and the export are the only consumers that need a full frame
+fdf = df.iloc[rows]
 
 # Allow download of filtered data
 st.sidebar.download_button(
     "Download filtered CSV",
-    fdf.to_csv(index=False).encode("utf-8"),
+    csv_bytes(fdf, source, start_d, end_d, prod_sel, chan_sel),
     file_name="filtered.csv",
     mime="text/csv",
 )
@@ -114,49 +254,62 @@ st.sidebar.download_button(
 # ---------------------------
 # KPIs
 # ---------------------------
-st.title("📊 Sales Dashboard")
+def render_kpis(revenue: np.ndarray, order_ids: np.ndarray, product: pd.Categorical) -> None:
+    total_rev, orders, aov, top_product_name, top_product_rev = compute_kpis(revenue, order_ids, product)
 
-total_rev = float(fdf["revenue"].sum()) if not fdf.empty else 0.0
-orders = int(fdf["order_id"].nunique()) if not fdf.empty else 0
-aov = (total_rev / orders) if orders else 0.0
-top_product_grp = fdf.groupby("product")["revenue"].sum().sort_values(ascending=False)
-top_product_name = top_product_grp.index[0] if len(top_product_grp) else "—"
-top_product_rev = float(top_product_grp.iloc[0]) if len(top_product_grp) else 0.0
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Total Revenue", f"${total_rev:,.0f}")
+    k2.metric("Orders", f"{orders:,}")
+    k3.metric("Avg. Order Value", f"${aov:,.2f}")
+    k4.metric("Top Product Revenue", f"${top_product_rev:,.0f}")
+    st.caption(f"Top product: {top_product_name}")
 
-k1, k2, k3, k4 = st.columns(4)
-k1.metric("Total Revenue", f"${total_rev:,.0f}")
-k2.metric("Orders", f"{orders:,}")
-k3.metric("Avg. Order Value", f"${aov:,.2f}")
-k4.metric("Top Product Revenue", f"${top_product_rev:,.0f}")
-st.caption(f"Top product: {top_product_name}")
+st.title("📊 Sales Dashboard")
+render_kpis(revenue, df["order_id"].to_numpy()[rows], product)
 
 # ---------------------------
 # Charts
 # ---------------------------
-if fdf.empty:
+def render_month_chart(mkeys: np.ndarray, revenue: np.ndarray) -> None:
+    months, totals = month_totals(mkeys, revenue)
+    fig = px.line(x=months, y=totals, markers=True, title="Revenue by Month",
+                  labels={"x": "month", "y": "revenue"})
+    fig.update_layout(yaxis_tickprefix="$")
+    st.plotly_chart(fig, use_container_width=True)
+
+def render_product_chart(product: pd.Categorical, revenue: np.ndarray) -> None:
+    names, totals = group_totals(product, revenue)
+    p = pd.DataFrame({"product": np.asarray(names), "revenue": totals}).sort_values("revenue", ascending=False)
+    fig = px.bar(p, x="product", y="revenue", title="Revenue by Product")
+    fig.update_layout(yaxis_tickprefix="$")
+    st.plotly_chart(fig, use_container_width=True)
+
+@st.fragment
+def render_table(fdf: pd.DataFrame) -> None:
+    table = fdf.drop(columns="_mkey").sort_values("date", ascending=False)
+    # Fixed label/key: a label containing the row count would reset the toggle on every filter change
+    if len(table) > TABLE_ROW_LIMIT and not st.checkbox("Show all rows", key="show_all_rows"):
+        st.caption(f"Showing the {TABLE_ROW_LIMIT:,} most recent of {len(table):,} orders.")
+        table = table.head(TABLE_ROW_LIMIT)
+    st.dataframe(table, use_container_width=True, height=420)
+
+if not len(rows):
     st.info("No data for the selected filters.")
 else:
-    fdf["month"] = fdf["date"].dt.to_period("M").dt.to_timestamp()
-
     col1, col2 = st.columns(2)
 
     with col1:
-        m = fdf.groupby("month")["revenue"].sum().reset_index()
-        fig = px.line(m, x="month", y="revenue", markers=True, title="Revenue by Month")
-        fig.update_layout(yaxis_tickprefix="$")
-        st.plotly_chart(fig, use_container_width=True)
+        render_month_chart(df["_mkey"].to_numpy()[rows], revenue)
 
     with col2:
-        p = fdf.groupby("product")["revenue"].sum().reset_index().sort_values("revenue", ascending=False)
-        fig = px.bar(p, x="product", y="revenue", title="Revenue by Product")
-        fig.update_layout(yaxis_tickprefix="$")
-        st.plotly_chart(fig, use_container_width=True)
+        render_product_chart(product, revenue)
 
     tab1, tab2 = st.tabs(["Orders Table", "Raw Data Snapshot"])
     with tab1:
-        st.dataframe(fdf.sort_values("date", ascending=False), use_container_width=True, height=420)
+        render_table(fdf)
     with tab2:
-        st.code(DATA_PATH.read_text()[:1000] + ("\n...\n" if DATA_PATH.stat().st_size > 1000 else ""), language="csv")
+        stat = DATA_PATH.stat()
+        st.code(csv_snapshot(DATA_PATH, stat.st_mtime, stat.st_size), language="csv")
 
 st.caption("Tip: Upload your CSV on the left or replace `data/sales.csv` to turn this into a client-ready dashboard.")
 